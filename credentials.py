@@ -0,0 +1,132 @@
+import pytumblr
+import threading
+import time
+
+from collections import deque
+from typing import Any, Dict, List
+
+from tumtum import constants
+
+
+CREDENTIAL_HOURLY_QUOTA = 1000
+CREDENTIAL_LIMITED_SECONDS = 15 * 60
+CREDENTIAL_MAX_FAILURES = 5
+
+
+class Credential:
+    def __init__(
+        self,
+        consumer_key: str,
+        consumer_secret: str,
+        oauth_token: str,
+        oauth_secret: str,
+        blogs: List[str]=None,
+        hourly_quota: int=CREDENTIAL_HOURLY_QUOTA,
+        name: str='',
+    ) -> None:
+        self.client = pytumblr.TumblrRestClient(
+            consumer_key,
+            consumer_secret,
+            oauth_token,
+            oauth_secret,
+        )
+        self.blogs = set(blogs or [])
+        self.hourly_quota = hourly_quota
+        self.name = name or consumer_key[:8]
+        self.calls: deque = deque()
+        self.failures = 0
+        self.limited_until = 0.0
+
+    def calls_last_hour(self) -> int:
+        cutoff = time.time() - 60 * 60
+        while self.calls and self.calls[0] < cutoff:
+            self.calls.popleft()
+        return len(self.calls)
+
+    def is_healthy(self) -> bool:
+        return (
+            time.time() >= self.limited_until
+            and self.calls_last_hour() < self.hourly_quota
+        )
+
+    def record(self, response: Any) -> None:
+        self.calls.append(time.time())
+        status = 200
+        if isinstance(response, dict):
+            status = response.get('meta', {}).get('status', 200)
+
+        if status == 429:
+            self.limited_until = time.time() + CREDENTIAL_LIMITED_SECONDS
+        elif status >= 500 or status == 401:
+            self.failures += 1
+            if self.failures >= CREDENTIAL_MAX_FAILURES:
+                self.limited_until = (
+                    time.time() + CREDENTIAL_LIMITED_SECONDS)
+                self.failures = 0
+        else:
+            self.failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'blogs': sorted(self.blogs),
+            'calls_last_hour': self.calls_last_hour(),
+            'hourly_quota': self.hourly_quota,
+            'healthy': self.is_healthy(),
+        }
+
+
+class CredentialPool:
+    def __init__(self, credentials: List[Credential]) -> None:
+        self.credentials = credentials
+        self.lock = threading.Lock()
+        self.next_read = 0
+
+    @classmethod
+    def from_constants(cls) -> 'CredentialPool':
+        # TUMBLR_CREDENTIALS is optional; fall back to the single account
+        configs = getattr(constants, 'TUMBLR_CREDENTIALS', None) or [{
+            'consumer_key': constants.TUMBLR_CONSUMER_KEY,
+            'consumer_secret': constants.TUMBLR_CONSUMER_SECRET,
+            'oauth_token': constants.OAUTH_TOKEN,
+            'oauth_secret': constants.OAUTH_SECRET,
+        }]
+        return cls([Credential(**config) for config in configs])
+
+    def get(
+        self,
+        blog: str='',
+        read_only: bool=False,
+    ) -> Credential:
+        with self.lock:
+            if blog:
+                for credential in self.credentials:
+                    if blog in credential.blogs:
+                        if not read_only or credential.is_healthy():
+                            return credential
+
+            if read_only:
+                # Round-robin reads over whichever accounts have room
+                num_credentials = len(self.credentials)
+                for offset in range(num_credentials):
+                    idx = (self.next_read + offset) % num_credentials
+                    credential = self.credentials[idx]
+                    if credential.is_healthy():
+                        self.next_read = idx + 1
+                        return credential
+
+            unmapped = [c for c in self.credentials if not c.blogs]
+            return (unmapped or self.credentials)[0]
+
+    def record(self, client, response: Any) -> None:
+        with self.lock:
+            for credential in self.credentials:
+                if credential.client is client:
+                    credential.record(response)
+                    return
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [
+                credential.stats() for credential in self.credentials
+            ]
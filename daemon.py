@@ -0,0 +1,260 @@
+import hmac
+import json
+import os
+import queue
+import secrets
+import socketserver
+import threading
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pprint import pformat
+from typing import Any, Dict
+
+from tumtum.post import Post
+
+
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = 8765
+DAEMON_WORKERS = 4
+DAEMON_MAX_JOBS = 1000
+DAEMON_WAIT_TIMEOUT = 60
+DAEMON_TOKEN_HEADER = 'X-Tumtum-Token'
+
+
+def make_post(body: Dict[str, Any]) -> Post:
+    post = Post(body.get('url'))
+    post.is_headless = True
+    return post
+
+
+def run_download(body: Dict[str, Any]) -> Dict[str, Any]:
+    return make_post(body).get_download_data()
+
+
+def run_images(body: Dict[str, Any]) -> Dict[str, Any]:
+    return make_post(body).post_images(body['images'])
+
+
+def run_reblog(body: Dict[str, Any]) -> Dict[str, Any]:
+    return make_post(body).post_reblog()
+
+
+def run_submissions(body: Dict[str, Any]) -> Dict[str, Any]:
+    return make_post(body).get_submissions(body['blog'])
+
+
+class Daemon:
+    routes: Dict[str, Dict[str, Any]] = {
+        '/download': {'run': run_download, 'required': ['url']},
+        '/images': {'run': run_images, 'required': ['url', 'images']},
+        '/reblog': {'run': run_reblog, 'required': ['url']},
+        '/submissions': {'run': run_submissions, 'required': ['blog']},
+    }
+
+    def __init__(self, num_workers: int=DAEMON_WORKERS) -> None:
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.jobs_lock = threading.Lock()
+        self.queue: queue.Queue = queue.Queue(maxsize=DAEMON_MAX_JOBS)
+        # Warm the shared client before the first request comes in
+        Post().get_client()
+        for _ in range(num_workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        with self.jobs_lock:
+            return dict(self.jobs.get(job_id, {}))
+
+    @staticmethod
+    def get_result_status(result: Any) -> str:
+        # Post methods and API responses report failures in the result
+        if isinstance(result, dict):
+            if 'status' in result:
+                return result['status']
+            status = result.get('meta', {}).get('status', 200)
+            if status >= 400:
+                return 'Error'
+        return 'success'
+
+    def submit(
+        self,
+        path: str,
+        body: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        route = self.routes.get(path)
+        if not route:
+            return {'status': 'Error', 'error': f'Unknown path {path}'}
+        if not isinstance(body, dict):
+            return {'status': 'Error', 'error': 'Body must be an object'}
+        missing = [key for key in route['required'] if not body.get(key)]
+        if missing:
+            return {
+                'status': 'Error',
+                'error': f'Missing {", ".join(missing)}',
+            }
+
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'path': path,
+            'status': 'queued',
+            'done': threading.Event(),
+        }
+        with self.jobs_lock:
+            if len(self.jobs) >= DAEMON_MAX_JOBS:
+                finished = [
+                    key for key, value in self.jobs.items()
+                    if value['done'].is_set()
+                ]
+                for key in finished[:len(finished) // 2 + 1]:
+                    del self.jobs[key]
+            self.jobs[job_id] = job
+        try:
+            self.queue.put_nowait((job, route['run'], body))
+        except queue.Full:
+            with self.jobs_lock:
+                del self.jobs[job_id]
+            return {'status': 'Busy', 'error': 'Too many queued jobs'}
+        return {'status': 'queued', 'id': job_id}
+
+    def wait(self, job_id: str, timeout: float=None) -> Dict[str, Any]:
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+        if job:
+            job['done'].wait(timeout)
+        return self.get_job(job_id)
+
+    def work(self) -> None:
+        while True:
+            job, run, body = self.queue.get()
+            job['status'] = 'running'
+            try:
+                result = run(body)
+                job['result'] = result
+                job['status'] = self.get_result_status(result)
+            except Exception as e:
+                job['error'] = pformat(e)
+                job['status'] = 'Error'
+            finally:
+                job['done'].set()
+                self.queue.task_done()
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    daemon: Daemon = None
+    token = ''
+
+    def address_string(self) -> str:
+        # Unix socket clients have no host/port pair
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def do_GET(self) -> None:
+        if not self.is_authorized():
+            return
+        parts = self.path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = self.daemon.get_job(parts[1])
+            self.send_json(200 if job else 404, job)
+        else:
+            self.send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self) -> None:
+        if not self.is_authorized():
+            return
+
+        # Browsers can only send JSON cross-origin after a CORS preflight
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.split(';')[0].strip() != 'application/json':
+            self.send_json(415, {
+                'status': 'Error',
+                'error': 'Content-Type must be application/json',
+            })
+            return
+
+        path, _, query = self.path.partition('?')
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError('Content-Length must not be negative')
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            self.send_json(400, {'status': 'Error', 'error': pformat(e)})
+            return
+
+        response = self.daemon.submit(path, body)
+        if response['status'] != 'queued':
+            self.send_json(
+                503 if response['status'] == 'Busy' else 400, response)
+        elif 'wait=1' in query.split('&'):
+            job = self.daemon.wait(response['id'], DAEMON_WAIT_TIMEOUT)
+            is_done = job.get('done') and job['done'].is_set()
+            self.send_json(200 if is_done else 202, job)
+        else:
+            self.send_json(202, response)
+
+    def is_authorized(self) -> bool:
+        # Unix sockets are protected by file permissions instead
+        if not self.token:
+            return True
+        token = self.headers.get(DAEMON_TOKEN_HEADER, '')
+        if hmac.compare_digest(token, self.token):
+            return True
+        self.send_json(401, {'status': 'Error', 'error': 'Bad token'})
+        return False
+
+    def send_json(self, code: int, data: Dict[str, Any]) -> None:
+        data = {k: v for k, v in data.items() if k != 'done'}
+        payload = json.dumps(data, default=str).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn,
+    socketserver.UnixStreamServer,
+):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ''
+
+
+def serve(
+    host: str=DAEMON_HOST,
+    port: int=DAEMON_PORT,
+    socket_path: str=None,
+    num_workers: int=DAEMON_WORKERS,
+    token: str=None,
+) -> None:
+    DaemonHandler.daemon = Daemon(num_workers)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, DaemonHandler)
+        os.chmod(socket_path, 0o600)
+        print(f'Listening on {socket_path}')
+    else:
+        token = token or os.environ.get('TUMTUM_DAEMON_TOKEN')
+        if not token:
+            token = secrets.token_urlsafe(32)
+            print(f'Send {DAEMON_TOKEN_HEADER}: {token}')
+        DaemonHandler.token = token
+        server = ThreadingHTTPServer((host, port), DaemonHandler)
+        print(f'Listening on http://{host}:{port}')
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == '__main__':
+    serve()
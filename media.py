@@ -0,0 +1,271 @@
+import os
+import re
+import requests
+import shutil
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Union
+
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_WORKERS = 4
+PROBE_WORKERS = 8
+URL_SIZE_CACHE_SIZE = 4096
+VIDEO_SEGMENTS = 4
+VIDEO_MIN_SEGMENT_SIZE = 1024 * 1024
+
+PHOTO_PROFILES: Dict[str, Dict[str, int]] = {
+    'thumbnail': {'max_width': 250},
+    'preview': {'max_width': 500},
+    'triage': {'max_width': 640, 'max_bytes': 200 * 1024},
+    'archive': {},
+}
+
+probe_executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS)
+CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-(\d+)/(?:\d+|\*)')
+UNSAFE_FILE_NAME_RE = re.compile(r'[\x00-\x1f/\\:*?"<>]+')
+FILE_NAME_MAX_LENGTH = 200
+
+upgrade_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+def download_file(url: str, path: str) -> str:
+    # Write to a temporary file so readers never see a partial download
+    tmp_path = f'{path}.part'
+    try:
+        with requests.get(
+            url,
+            stream=True,
+            timeout=DOWNLOAD_TIMEOUT,
+        ) as r:
+            r.raise_for_status()
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(r.raw, f, DOWNLOAD_CHUNK_SIZE)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def download_range(
+    url: str,
+    path: str,
+    start: int,
+    end: int,
+) -> int:
+    headers = {'Range': f'bytes={start}-{end}'}
+    with requests.get(
+        url,
+        headers=headers,
+        stream=True,
+        timeout=DOWNLOAD_TIMEOUT,
+    ) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise RangeNotSupported(url)
+        # Writing a different range than requested would corrupt the file
+        match = CONTENT_RANGE_RE.match(r.headers.get('Content-Range', ''))
+        if not match or (int(match[1]), int(match[2])) != (start, end):
+            raise RangeNotSupported(url)
+        written = 0
+        with open(path, 'r+b') as f:
+            f.seek(start)
+            for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                written += len(chunk)
+
+    if written != end - start + 1:
+        raise IOError(
+            f'Expected {end - start + 1} bytes from {url}, got {written}')
+    return written
+
+
+def download_segments(
+    url: str,
+    path: str,
+    size: int,
+    num_segments: int,
+) -> None:
+    tmp_path = f'{path}.part'
+    # Preallocate so every segment can write at its own offset
+    with open(tmp_path, 'wb') as f:
+        f.truncate(size)
+
+    segment_size = -(-size // num_segments)
+    ranges = [
+        (start, min(start + segment_size, size) - 1)
+        for start in range(0, size, segment_size)
+    ]
+    try:
+        with ThreadPoolExecutor(max_workers=num_segments) as executor:
+            futures = [
+                executor.submit(download_range, url, tmp_path, start, end)
+                for start, end in ranges
+            ]
+            written = sum(future.result() for future in futures)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    if written != size:
+        os.remove(tmp_path)
+        raise IOError(f'Expected {size} bytes from {url}, got {written}')
+    os.replace(tmp_path, path)
+
+
+def download_video(
+    url: str,
+    path: str,
+    num_segments: int=VIDEO_SEGMENTS,
+) -> Dict[str, Any]:
+    started = time.time()
+    size, accepts_ranges = probe_url(url)
+    num_segments = min(
+        num_segments, size // VIDEO_MIN_SEGMENT_SIZE)
+
+    if accepts_ranges and num_segments > 1:
+        try:
+            download_segments(url, path, size, num_segments)
+        except RangeNotSupported:
+            num_segments = 1
+    else:
+        num_segments = 1
+
+    if num_segments == 1:
+        download_file(url, path)
+
+    num_bytes = os.path.getsize(path)
+    if size and num_bytes != size:
+        raise IOError(
+            f'Expected {size} bytes from {url}, got {num_bytes}')
+
+    seconds = max(time.time() - started, 1e-6)
+    return {
+        'path': path,
+        'bytes': num_bytes,
+        'seconds': seconds,
+        'segments': num_segments,
+        'throughput': num_bytes / seconds,
+    }
+
+
+@lru_cache(maxsize=URL_SIZE_CACHE_SIZE)
+def fetch_url_size(url: str) -> int:
+    # Raises on failure so that only real sizes end up in the cache
+    response = requests.head(
+        url,
+        allow_redirects=True,
+        timeout=DOWNLOAD_TIMEOUT,
+    )
+    response.raise_for_status()
+    return int(response.headers['Content-Length'])
+
+
+def get_photo_profile(
+    profile: Union[str, Dict[str, int]]=None,
+) -> Dict[str, int]:
+    if isinstance(profile, dict):
+        return profile
+    profile = profile or 'archive'
+    if profile not in PHOTO_PROFILES:
+        raise ValueError(
+            f'Unknown photo profile {profile!r}, '
+            f'expected one of {", ".join(PHOTO_PROFILES)}'
+        )
+    return PHOTO_PROFILES[profile]
+
+
+def get_photo_sizes(photo: Dict[str, Any]) -> List[Dict[str, Any]]:
+    sizes = {}
+    for size in [photo.get('original_size')] + photo.get('alt_sizes', []):
+        if size and size.get('url'):
+            sizes.setdefault(size['url'], size)
+    return sorted(
+        sizes.values(),
+        key=lambda size: size.get('width', 0),
+        reverse=True,
+    )
+
+
+def get_url_size(url: str) -> int:
+    try:
+        return fetch_url_size(url)
+    except (requests.RequestException, KeyError, ValueError):
+        return 0
+
+
+def probe_url(url: str) -> Tuple[int, bool]:
+    # Many CDNs refuse HEAD, which just means a single-stream download
+    try:
+        response = requests.head(
+            url,
+            allow_redirects=True,
+            timeout=DOWNLOAD_TIMEOUT,
+        )
+        response.raise_for_status()
+    except requests.RequestException:
+        return 0, False
+    try:
+        size = int(response.headers.get('Content-Length', 0))
+    except ValueError:
+        size = 0
+    accepts_ranges = (
+        response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    )
+    return size, accepts_ranges and size > 0
+
+
+def safe_file_name(name: str) -> str:
+    name = UNSAFE_FILE_NAME_RE.sub(' ', name)
+    return name.strip(' .')[:FILE_NAME_MAX_LENGTH]
+
+
+def select_photo_size(
+    photo: Dict[str, Any],
+    profile: Union[str, Dict[str, int]]=None,
+) -> Dict[str, Any]:
+    profile = get_photo_profile(profile)
+    max_width = profile.get('max_width', 0)
+    max_bytes = profile.get('max_bytes', 0)
+
+    sizes = get_photo_sizes(photo)
+    if not sizes:
+        return {}
+
+    candidates = [
+        size for size in sizes
+        if not max_width or size.get('width', 0) <= max_width
+    ] or sizes[-1:]
+
+    if max_bytes:
+        # Sizes are widest first, so the first one that fits is the best
+        sizes_bytes = probe_executor.map(
+            get_url_size, [size['url'] for size in candidates])
+        for size, num_bytes in zip(candidates, sizes_bytes):
+            if num_bytes and num_bytes <= max_bytes:
+                return size
+        return candidates[-1]
+
+    return candidates[0]
+
+
+def upgrade_photos(
+    media: List[Dict[str, str]],
+    paths: List[str],
+) -> List[Future]:
+    # Replace previously downloaded thumbnails with their originals
+    return [
+        upgrade_executor.submit(
+            download_file, item['original_url'], path)
+        for item, path in zip(media, paths)
+        if item.get('original_url')
+    ]
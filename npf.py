@@ -0,0 +1,106 @@
+import re
+
+from typing import Any, Dict, Iterator, List, Union
+
+from tumtum import media
+
+
+HTML_MEDIA_RE = re.compile(
+    r'<(?P<tag>img|video|audio|source)\b[^>]*?\bsrc=["\'](?P<url>[^"\']+)',
+    re.IGNORECASE,
+)
+HTML_MEDIA_TYPES = {
+    'img': 'image',
+    'video': 'video',
+    'audio': 'audio',
+    'source': 'video',
+}
+
+# Legacy HTML fields that can embed media, per post type
+LEGACY_HTML_FIELDS: Dict[str, List[str]] = {
+    'answer': ['answer'],
+    'audio': ['player'],
+    'link': ['description'],
+    'quote': ['text', 'source'],
+    'text': ['body'],
+}
+
+
+def iter_block_media(
+    block: Dict[str, Any],
+    profile: Union[str, Dict[str, int]]=None,
+) -> Iterator[Dict[str, str]]:
+    block_type = block.get('type')
+    if block_type == 'image':
+        sizes = block.get('media', [])
+        size = media.select_photo_size({'alt_sizes': sizes}, profile)
+        if size:
+            item = {'type': 'image', 'url': size['url']}
+            original = media.select_photo_size({'alt_sizes': sizes})
+            if original and original['url'] != size['url']:
+                item['original_url'] = original['url']
+            yield item
+    elif block_type in ('video', 'audio'):
+        block_media = block.get('media') or {}
+        if isinstance(block_media, list):
+            block_media = block_media[0] if block_media else {}
+        url = block_media.get('url') or block.get('url')
+        if url:
+            yield {'type': block_type, 'url': url}
+
+
+def iter_content_media(
+    content: Union[str, List[Dict[str, Any]]],
+    profile: Union[str, Dict[str, int]]=None,
+) -> Iterator[Dict[str, str]]:
+    # Legacy trails carry HTML strings, NPF trails carry block lists
+    if isinstance(content, str):
+        yield from iter_html_media(content)
+    else:
+        for block in content or []:
+            yield from iter_block_media(block, profile)
+
+
+def iter_html_media(html: str) -> Iterator[Dict[str, str]]:
+    for match in HTML_MEDIA_RE.finditer(html or ''):
+        yield {
+            'type': HTML_MEDIA_TYPES[match['tag'].lower()],
+            'url': match['url'],
+        }
+
+
+def iter_post_media(
+    post: Dict[str, Any],
+    profile: Union[str, Dict[str, int]]=None,
+) -> Iterator[Dict[str, str]]:
+    seen = set()
+    for item in iter_post_media_raw(post, profile):
+        if item['url'] not in seen:
+            seen.add(item['url'])
+            yield item
+
+
+def iter_post_media_raw(
+    post: Dict[str, Any],
+    profile: Union[str, Dict[str, int]]=None,
+) -> Iterator[Dict[str, str]]:
+    if 'content' in post:
+        yield from iter_content_media(post['content'], profile)
+        for trail_item in post.get('trail', []):
+            yield from iter_content_media(
+                trail_item.get('content', []), profile)
+        return
+
+    post_type = post.get('type', '')
+    if post_type == 'audio' and post.get('audio_url'):
+        yield {'type': 'audio', 'url': post['audio_url']}
+    for photo in post.get('photos', []):
+        size = media.select_photo_size(photo, profile)
+        if size:
+            item = {'type': 'image', 'url': size['url']}
+            original_url = photo.get('original_size', {}).get('url')
+            if original_url and original_url != size['url']:
+                item['original_url'] = original_url
+            yield item
+    for field in LEGACY_HTML_FIELDS.get(post_type, []):
+        yield from iter_html_media(post.get(field, ''))
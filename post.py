@@ -1,33 +1,50 @@
 import dialogs
-import pytumblr
+import itertools
+import os
 import re
 import secrets
+import threading
+import time
 
 from pprint import pformat, pprint
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Set, Tuple, Union
 from urllib.parse import urlparse
 
 from tumtum import (
-    constants, helpers, submissions
+    constants, helpers, media, npf, profiling, submissions, urls
 )
+from tumtum.credentials import CredentialPool
 from tumtum.super_post import SuperPost
 
 
+POST_CACHE_SIZE = 512
+POST_CACHE_TTL = 5 * 60
+WRITABLE_BLOGS_CACHE_TTL = 60 * 60
+
+
 class Post(SuperPost):
+    is_headless = False
     is_reblog = False
     is_submission = False
     netloc = ''
     blog_name = ''
     post_id = 0
+    photo_profile: Union[str, Dict[str, int]] = 'archive'
+
+    # Shared by every instance so long-running processes stay warm
+    credentials: CredentialPool = None
+    post_cache: Dict[Tuple[str, int], Tuple[float, Dict[str, Any]]] = {}
+    post_cache_lock = threading.Lock()
+    writable_blogs_cache: Dict[int, Tuple[float, Set[str]]] = {}
 
     def __init__(self, post_url: str=None) -> None:
         if post_url is not None:
             self.is_reblog = '#reblog' in post_url
-            self.netloc = self.get_netloc(post_url)
-            self.blog_name = self.get_post_blog()
-            self.post_id = self.get_post_id_from_url(
-                post_url,
-            )
+            (
+                self.netloc,
+                self.blog_name,
+                self.post_id,
+            ) = urls.resolve_post_url(post_url)
 
     def additional_text_html(
         self,
@@ -40,6 +57,49 @@ class Post(SuperPost):
             return f'<p>{text}</p>'
         return ''
 
+    def cache_post(
+        self,
+        cache_key: Tuple[str, int],
+        post: Dict[str, Any],
+    ) -> None:
+        now = time.time()
+        with self.post_cache_lock:
+            self.post_cache.pop(cache_key, None)
+            # Entries are in insertion order, so the oldest come first
+            for key, (cached_at, _) in list(self.post_cache.items()):
+                is_full = len(self.post_cache) >= POST_CACHE_SIZE
+                if not is_full and now - cached_at < POST_CACHE_TTL:
+                    break
+                del self.post_cache[key]
+            self.post_cache[cache_key] = (now, post)
+
+    def download_videos(
+        self,
+        post_info: Dict[str, Any],
+        directory: str,
+    ) -> List[Dict[str, Any]]:
+        stats = []
+        if post_info.get('type') != 'video':
+            return stats
+
+        folder = post_info.get('folder', '')
+        for item in post_info.get('media', []):
+            url = item.get('url')
+            if not url:
+                continue
+            ext = os.path.splitext(urlparse(url).path)[1] or '.mp4'
+            file_name = media.safe_file_name(
+                f'{folder}{item["title"]}') or str(self.post_id)
+            path = os.path.join(directory, f'{file_name}{ext}')
+            stat = media.download_video(url, path)
+            print(
+                f'Downloaded {path} in {stat["segments"]} segment(s):',
+                f'{stat["bytes"] / 1e6:.1f} MB at',
+                f'{stat["throughput"] / 1e6:.1f} MB/s',
+            )
+            stats.append(stat)
+        return stats
+
     def fill_form(
         self,
         post: Dict[str, Any]=None,
@@ -102,21 +162,41 @@ class Post(SuperPost):
                     'value': should_keep_tree,
                 })
 
+        if self.is_headless:
+            return {
+                field['key']: field['value'] for field in fields
+            }
+
         return dialogs.form_dialog(
             title='Questions',
             fields=fields,
         ) or {}
 
-    def get_client(self):
-        return pytumblr.TumblrRestClient(
-            constants.TUMBLR_CONSUMER_KEY,
-            constants.TUMBLR_CONSUMER_SECRET,
-            constants.OAUTH_TOKEN,
-            constants.OAUTH_SECRET,
-        )
+    @classmethod
+    def from_urls(cls, post_urls: List[str]) -> List['Post']:
+        # Resolve short links and custom domains concurrently up front
+        urls.resolve_post_urls(post_urls)
+        return [cls(post_url) for post_url in post_urls]
 
-    def get_download_and_post_data(self) -> Dict[str, Any]:
-        post = self.get_post_from_post_id()
+    def get_client(
+        self,
+        blog: str='',
+        read_only: bool=False,
+    ):
+        if Post.credentials is None:
+            Post.credentials = CredentialPool.from_constants()
+        return Post.credentials.get(blog, read_only).client
+
+    @profiling.profiled
+    def get_download_and_post_data(
+        self,
+        post: Dict[str, Any]=None,
+    ) -> Dict[str, Any]:
+        if post:
+            self.is_submission = post.get(
+                'is_submission', False)
+        else:
+            post = self.get_post_from_post_id()
         post_type = post.get('type', 'photo')
 
         media = self.get_media_from_post(post, post_type)
@@ -157,6 +237,7 @@ class Post(SuperPost):
             'media': media,
         }
 
+    @profiling.profiled
     def get_download_data(self) -> Dict[str, Any]:
         post = self.get_post_from_post_id()
         if post:
@@ -199,7 +280,7 @@ class Post(SuperPost):
         post_author = self.get_post_author(post)
         if post_author:
             options = [f'{post_author}.tumblr.com']
-        if tags:
+        if tags and not self.is_headless:
             options += tags + [
                 constants.FORM_BLANK, self.netloc
             ]
@@ -234,6 +315,7 @@ class Post(SuperPost):
             self.is_reblog
             and links
             and not self.is_submission
+            and not self.is_headless
         )
         if can_link:
             tag = dialogs.list_dialog(
@@ -257,52 +339,70 @@ class Post(SuperPost):
                 return url, url_text
         return ('', '')
 
+    @profiling.profiled
     def get_media_from_post(
         self,
         post: Dict[str, Any]={},
         post_type: str='',
+        limit: int=None,
     ) -> List[Dict[str, str]]:
         summary = post.get('summary', '')
 
         media = []
-        if post_type and post_type == 'photo':
-            photos = post.get('photos', [])
+        if post_type and post_type == 'photo' and 'photos' in post:
+            photos = post.get('photos', [])[:limit]
             media = self.get_photos_info(
                 photos, summary)
-        elif post_type and post_type == 'video':
+        elif post_type and post_type == 'video' and 'video_url' in post:
             media.append({
                 'title': self.get_file_name(
                     summary),
                 'url': post.get('video_url')
             })
+        elif post:
+            # Walk NPF blocks lazily so long trails stop at the limit
+            items = list(itertools.islice(
+                npf.iter_post_media(post, self.photo_profile),
+                limit,
+            ))
+            for idx, item in enumerate(items):
+                number = f' {idx + 1}' if len(items) > 1 else ''
+                item['title'] = self.get_file_name(summary, number)
+                media.append(item)
         return media
 
     def get_netloc(self, url: str='') -> str:
-        if url and self.is_tumblr_url(url):
-            return urlparse(url).netloc
-        return ''
+        return urls.parse_post_url(url)[0]
 
     def get_photos_info(
         self,
         photos: List[Dict[str, Any]],
         summary: str,
+        profile: Union[str, Dict[str, int]]=None,
     ) -> List[Dict[str, str]]:
+        profile = profile or self.photo_profile
         num_photos = len(photos)
-        media = []
+        photos_info = []
         for idx, photo in enumerate(photos):
             caption = photo.get('caption', '') or summary
             photo_num = ''
             if num_photos > 1:
                 photo_num = f' {idx + 1}'
-            photo_url = photo.get(
+            original_url = photo.get(
                 'original_size', {}).get('url', '')
-            media.append({
+            photo_url = media.select_photo_size(
+                photo, profile).get('url', original_url)
+            photo_info = {
                 'title': self.get_file_name(
                     caption, photo_num),
                 'url': photo_url,
-            })
+            }
+            # Lets callers fetch the small size now and upgrade later
+            if original_url and photo_url != original_url:
+                photo_info['original_url'] = original_url
+            photos_info.append(photo_info)
 
-        return media
+        return photos_info
 
     def get_post_author(self, post: Dict[str, Any]) -> str:
         if post and self.is_submission:
@@ -310,47 +410,79 @@ class Post(SuperPost):
         return ''
 
     def get_post_blog(self, url: str='') -> str:
-        if self.netloc:
-            return self.netloc.split('.')[0]
-        return ''
+        if url:
+            return urls.parse_post_url(url)[1]
+        return self.blog_name
 
-    def get_post_from_post_id(self) -> Dict[str, Any]:
+    def get_post_from_post_id(
+        self,
+        show_errors: bool=True,
+    ) -> Dict[str, Any]:
         if self.post_id:
-            client = self.get_client()
+            cache_key = (self.blog_name, self.post_id)
+            cached_at, post = self.post_cache.get(
+                cache_key, (0, {}))
+            if post and time.time() - cached_at < POST_CACHE_TTL:
+                self.is_submission = post.get(
+                    'is_submission', False)
+                return post
+
+            client = self.get_client(
+                self.blog_name, read_only=True)
             response = client.posts(
                 self.blog_name,
                 id=self.post_id,
             )
+            self.record_response(client, response)
             status = (
                 response
                 .get('meta', {})
                 .get('status', 200)
             )
-            if status != 200:
-                dialogs.alert(
-                    title='Error',
-                    message=pformat(response),
-                )
+            if status != 200 and show_errors:
+                self.show_error(response)
 
             posts = response.get('posts')
             if posts:
                 post = posts[0]
+                self.cache_post(cache_key, post)
                 self.is_submission = post.get(
                     'is_submission', False)
                 return post
         return {}
 
     def get_post_id_from_url(self, url: str) -> int:
-        if url and self.is_tumblr_url(url):
-            return int(
-                urlparse(url).path.split('/')[2])
-        return 0
+        return urls.parse_post_url(url)[2]
 
     @staticmethod
     def get_reblog_key(post: Dict[str, str]) -> str:
         if post:
             return post.get('reblog_key')
 
+    def get_submissions(self, blog: str) -> Dict[str, Any]:
+        # Submissions are only visible to the account that owns the blog
+        client = self.get_client(blog)
+        response = client.submission(blog)
+        self.record_response(client, response)
+        return response
+
+    def get_writable_blogs(self, blog: str='') -> Set[str]:
+        client = self.get_client(blog)
+        cached_at, blogs = self.writable_blogs_cache.get(
+            id(client), (0, set()))
+        if blogs and time.time() - cached_at < WRITABLE_BLOGS_CACHE_TTL:
+            return blogs
+
+        response = client.info()
+        self.record_response(client, response)
+        blogs = {
+            user_blog.get('name')
+            for user_blog in response.get('user', {}).get('blogs', [])
+        }
+        if blogs:
+            self.writable_blogs_cache[id(client)] = (time.time(), blogs)
+        return blogs
+
     @staticmethod
     def has_bottom(line: str) -> bool:
         return re.match(
@@ -544,9 +676,11 @@ class Post(SuperPost):
 
     def like_post(self, post: Dict[str, str]) -> None:
         reblog_key = self.get_reblog_key(post)
-        self.get_client().like(
-            self.post_id, reblog_key)
+        client = self.get_client(self.blog_name)
+        response = client.like(self.post_id, reblog_key)
+        self.record_response(client, response)
 
+    @profiling.profiled
     def make_caption(
         self,
         blog: str,
@@ -645,8 +779,8 @@ class Post(SuperPost):
                 new_list.append(line)
         return new_list
 
-    @staticmethod
     def make_tags(
+        self,
         info_list: str,
         post_type: str,
     ) -> str:
@@ -665,6 +799,9 @@ class Post(SuperPost):
         # post_type tag
         tags.append(post_type)
 
+        if self.is_headless:
+            return ','.join(tags[:30])
+
         # extra tags
         extra_tag_objs = dialogs.list_dialog(
             title='Tag Selector',
@@ -695,13 +832,12 @@ class Post(SuperPost):
         if not images:
             dialogs.alert(title='No images input')
 
-        client = self.get_client()
-
         post_info = self.get_download_and_post_data()
         blog_captions = post_info.get('blog_captions')
         for caption in blog_captions:
             tags = helpers.split_list(post_info.get('tags'))
 
+            client = self.get_client(caption.get('blog', ''))
             response = client.create_photo(
                 caption.get('blog', ''),
                 caption=caption.get('caption', ''),
@@ -710,14 +846,24 @@ class Post(SuperPost):
                 photoset_layout='1'[:1] * len(images),
                 state='queue',
             )
+            self.record_response(client, response)
         return response
 
-    def post_reblog(self) -> Dict[str, Any]:
-        client = self.get_client()
-        post_info = self.get_download_and_post_data()
-        blog_captions = post_info.get('blog_captions')
-        blogs = [
-            caption['blog'] for caption in blog_captions
+    def post_reblog(
+        self,
+        post: Dict[str, Any]=None,
+    ) -> Dict[str, Any]:
+        post_info = self.get_download_and_post_data(post)
+        blogs, problems = self.preflight_reblog(
+            post_info.get('post_id'),
+            post_info.get('reblog_key'),
+            [caption['blog'] for caption in post_info['blog_captions']],
+        )
+        if problems:
+            self.show_error(problems)
+        blog_captions = [
+            caption for caption in post_info['blog_captions']
+            if caption['blog'] in blogs
         ]
 
         for caption in blog_captions:
@@ -726,6 +872,7 @@ class Post(SuperPost):
                 constants.POST_STATES)
             blog = caption.get('blog')
 
+            client = self.get_client(blog)
             response = client.reblog(
                 blog,
                 id=post_info.get('post_id'),
@@ -736,11 +883,9 @@ class Post(SuperPost):
                     'keep_tree'),
                 state=random_state,
             )
+            self.record_response(client, response)
             if not response.get('id'):
-                dialogs.alert(
-                    title='Error',
-                    message=pformat(response)
-                )
+                self.show_error(response)
 
         print(
             f'Reblogged to {len(blogs)} blog(s):',
@@ -749,7 +894,6 @@ class Post(SuperPost):
         return post_info
 
     def post_reblog_original(self) -> None:
-        client = self.get_client()
         post = self.get_post_from_post_id()
         tags = post.get('tags')
         reblog_key = self.get_reblog_key(post)
@@ -761,7 +905,13 @@ class Post(SuperPost):
             items=constants.POST_STATES,
         )
 
-        for blog in constants.BLOGS:
+        blogs, problems = self.preflight_reblog(
+            self.post_id, reblog_key, constants.BLOGS)
+        if problems:
+            self.show_error(problems)
+
+        for blog in blogs:
+            client = self.get_client(blog)
             response = client.reblog(
                 blog,
                 id=self.post_id,
@@ -770,32 +920,29 @@ class Post(SuperPost):
                 tags=tags,
                 state=state,
             )
+            self.record_response(client, response)
             if not response.get('id'):
-                dialogs.alert(
-                    title='Error',
-                    message=pformat(response)
-                )
+                self.show_error(response)
 
         print(
             'Reblogged to all blogs:',
-            pformat(constants.BLOGS),
+            pformat(blogs),
         )
 
     def post_submission(self) -> None:
-        client = self.get_client()
         blog = dialogs.list_dialog(
             title='Submissions from which blog?',
             items=constants.BLOGS,
             multiple=False,
         )
-        submissions = client.submission(blog)
+        submissions = self.get_submissions(blog)
         dialogs.text_dialog(
             title='',
             text=pformat(submissions)
         )
 
     def post_submission_request(self, blog: str) -> None:
-        client = self.get_client()
+        client = self.get_client(blog)
         response = client.create_text(
             blog,
             title=submissions.REQUEST_TITLE,
@@ -805,6 +952,7 @@ class Post(SuperPost):
             state='queue',
             tags=[]
         )
+        self.record_response(client, response)
         pprint(response)
         dialogs.hud_alert(
             message=f'Submissions requested: {blog}',
@@ -812,6 +960,33 @@ class Post(SuperPost):
             duration=2,
         )
 
+    def preflight_reblog(
+        self,
+        post_id: int,
+        reblog_key: str,
+        blogs: List[str],
+    ) -> Tuple[List[str], List[Dict[str, str]]]:
+        # Catch doomed reblogs before any write quota is spent
+        if not post_id or not reblog_key:
+            return [], [{
+                'post_id': str(post_id),
+                'reason': 'Source post or reblog key is missing',
+            }]
+
+        valid_blogs = []
+        problems = []
+        for blog in blogs:
+            # An empty set means the lookup failed, so let the write decide
+            writable_blogs = self.get_writable_blogs(blog)
+            if not writable_blogs or blog in writable_blogs:
+                valid_blogs.append(blog)
+            else:
+                problems.append({
+                    'blog': blog,
+                    'reason': 'Blog does not accept posts from this account',
+                })
+        return valid_blogs, problems
+
     @staticmethod
     def process_social(
         line: str,
@@ -828,6 +1003,10 @@ class Post(SuperPost):
 
         return line
 
+    def record_response(self, client, response: Any) -> None:
+        if Post.credentials is not None:
+            Post.credentials.record(client, response)
+
     def should_keep_tree(self, post: Dict[str, str]) -> bool:
         if post and self.is_reblog:
             trail = post.get('trail', [])
@@ -842,6 +1021,15 @@ class Post(SuperPost):
                     return True
         return False
 
+    def show_error(self, response: Any) -> None:
+        if self.is_headless:
+            print('Error:', pformat(response))
+        else:
+            dialogs.alert(
+                title='Error',
+                message=pformat(response),
+            )
+
     @staticmethod
     def social_media_name(
         line: str,
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from tumtum.post import Post
+
+
+PREFLIGHT_WORKERS = 8
+
+# (source post, target blogs, optional reblog key the caller expects)
+Candidate = Tuple[Post, List[str], str]
+
+
+def preflight_reblogs(
+    candidates: List[Candidate],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+    with ThreadPoolExecutor(max_workers=PREFLIGHT_WORKERS) as executor:
+        # Fetch every source post and account blog list concurrently.
+        # Both land in Post's caches for the checks below.
+        posts = list(executor.map(
+            lambda candidate: candidate[0].get_post_from_post_id(
+                show_errors=False),
+            candidates,
+        ))
+        # Blog lists are cached per credential, so look each one up once
+        post_obj = Post()
+        post_obj.get_client()
+        blog_per_credential = {}
+        for _, blogs, _ in candidates:
+            for blog in blogs:
+                credential = post_obj.credentials.get(blog)
+                blog_per_credential.setdefault(id(credential), blog)
+        list(executor.map(
+            post_obj.get_writable_blogs,
+            blog_per_credential.values(),
+        ))
+
+    valid = []
+    problems = []
+    for (post_obj, blogs, expected_key), post in zip(candidates, posts):
+        url = f'{post_obj.netloc}/post/{post_obj.post_id}'
+        reblog_key = post_obj.get_reblog_key(post)
+        if not post:
+            problems.append({'url': url, 'reason': 'Source post not found'})
+            continue
+        if expected_key and expected_key != reblog_key:
+            problems.append({'url': url, 'reason': 'Reblog key is stale'})
+            continue
+
+        valid_blogs, blog_problems = post_obj.preflight_reblog(
+            post_obj.post_id, reblog_key, blogs)
+        problems += [dict(problem, url=url) for problem in blog_problems]
+        if valid_blogs:
+            valid.append({
+                'post_obj': post_obj,
+                'post': post,
+                'blogs': valid_blogs,
+            })
+    return valid, problems
@@ -0,0 +1,165 @@
+import cProfile
+import contextlib
+import functools
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List
+
+
+PROFILE_DIR = 'profiles'
+PROFILE_SNAPSHOT_INTERVAL = 1.0
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_TOP_STATS = 40
+
+settings: Dict[str, Any] = {
+    'enabled': bool(os.environ.get('TUMTUM_PROFILE')),
+    'directory': os.environ.get('TUMTUM_PROFILE_DIR') or PROFILE_DIR,
+    'snapshot_interval': PROFILE_SNAPSHOT_INTERVAL,
+    'sample_interval': PROFILE_SAMPLE_INTERVAL,
+}
+# cProfile and tracemalloc are process-wide, so only one run at a time
+run_lock = threading.Lock()
+run_counter = itertools.count(1)
+run_owner: Dict[str, int] = {}
+
+
+class ProfileRun:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.profiler = cProfile.Profile()
+        self.stacks: Counter = Counter()
+        self.snapshots: List[tracemalloc.Snapshot] = []
+        self.stopped = threading.Event()
+        self.thread_id = threading.get_ident()
+        self.started_tracemalloc = False
+
+    def sample(self) -> None:
+        # Periodically record the profiled thread's stack and memory
+        next_snapshot = time.time() + settings['snapshot_interval']
+        while not self.stopped.wait(settings['sample_interval']):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f'{code.co_name} ({os.path.basename(code.co_filename)}'
+                    f':{code.co_firstlineno})'
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+            if time.time() >= next_snapshot:
+                self.snapshots.append(tracemalloc.take_snapshot())
+                next_snapshot = time.time() + settings['snapshot_interval']
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        self.snapshots.append(tracemalloc.take_snapshot())
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        self.profiler.enable()
+
+    def stop(self) -> None:
+        self.profiler.disable()
+        self.stopped.set()
+        self.sampler.join()
+        self.snapshots.append(tracemalloc.take_snapshot())
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        self.write()
+
+    def write(self) -> None:
+        directory = settings['directory']
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.name)
+
+        self.profiler.dump_stats(f'{path}.pstats')
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(
+            'cumulative').print_stats(PROFILE_TOP_STATS)
+        with open(f'{path}.cpu.txt', 'w') as f:
+            f.write(stream.getvalue())
+
+        with open(f'{path}.collapsed', 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+        first = self.snapshots[0]
+        with open(f'{path}.alloc.txt', 'w') as f:
+            for idx, snapshot in enumerate(self.snapshots[1:], 1):
+                f.write(f'# Snapshot {idx}: growth since start\n')
+                stats = snapshot.compare_to(first, 'lineno')
+                for stat in stats[:PROFILE_TOP_STATS]:
+                    f.write(f'{stat}\n')
+                f.write('\n')
+
+        print(f'Profile written to {path}.*')
+
+
+def disable() -> None:
+    settings['enabled'] = False
+
+
+def enable(
+    directory: str=PROFILE_DIR,
+    snapshot_interval: float=PROFILE_SNAPSHOT_INTERVAL,
+    sample_interval: float=PROFILE_SAMPLE_INTERVAL,
+) -> None:
+    settings.update({
+        'enabled': True,
+        'directory': directory,
+        'snapshot_interval': snapshot_interval,
+        'sample_interval': sample_interval,
+    })
+
+
+def profiled(func: Callable) -> Callable:
+    # Fallback for standalone calls; batch loops should wrap run() instead
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with run(func.__qualname__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def run(name: str) -> Iterator[None]:
+    if not settings['enabled']:
+        yield
+        return
+    if not run_lock.acquire(blocking=False):
+        # Nested runs belong to the active one, but it only watches its
+        # own thread, so runs on other threads are skipped outright
+        if run_owner.get('thread_id') != threading.get_ident():
+            print(f'Not profiling {name}, another run is active')
+        yield
+        return
+
+    profile_run = ProfileRun('-'.join([
+        name,
+        time.strftime('%Y%m%d-%H%M%S'),
+        str(os.getpid()),
+        str(next(run_counter)),
+    ]))
+    run_owner['thread_id'] = threading.get_ident()
+    try:
+        profile_run.start()
+        try:
+            yield
+        finally:
+            profile_run.stop()
+    finally:
+        run_owner.clear()
+        run_lock.release()
@@ -0,0 +1,96 @@
+import re
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+URL_CACHE_SIZE = 4096
+URL_RESOLVE_TIMEOUT = 10
+URL_RESOLVE_WORKERS = 8
+
+POST_URL_RE = re.compile(
+    r'''
+    ^(?:https?://)?
+    (?:
+        (?:www\.)?tumblr\.com/blog/view/
+        (?P<view_blog>[\w-]+)/(?P<view_id>\d+)
+      | (?:www\.)?tumblr\.com/
+        (?P<dash_blog>[\w-]+)/(?P<dash_id>\d+)
+      | (?P<host>[\w.-]+\.[a-z]{2,})(?::\d+)?/post/
+        (?P<post_id>\d+)
+    )
+    (?:[/?#]|$)
+    ''',
+    re.IGNORECASE | re.VERBOSE,
+)
+
+PostLocation = Tuple[str, str, int]
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def fetch_post_url(url: str) -> PostLocation:
+    # Network errors propagate, so lru_cache never stores a failed lookup
+    parsed = urlparse(url)
+    if parsed.netloc.lower() == 't.umblr.com':
+        # Outbound redirects carry their target in the query string
+        target = parse_qs(parsed.query).get('z', [''])[0]
+        if target:
+            return parse_post_url(target)
+
+    response = requests.head(
+        url,
+        allow_redirects=True,
+        timeout=URL_RESOLVE_TIMEOUT,
+    )
+    return parse_post_url(response.url)
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def parse_post_url(url: str) -> PostLocation:
+    match = POST_URL_RE.match(url.strip()) if url else None
+    if not match:
+        return ('', '', 0)
+
+    blog = match['view_blog'] or match['dash_blog']
+    if blog:
+        post_id = match['view_id'] or match['dash_id']
+        return (f'{blog}.tumblr.com', blog, int(post_id))
+
+    host = match['host'].lower()
+    if host.endswith('.tumblr.com'):
+        blog = host.split('.')[0]
+    else:
+        # The API accepts custom domains as blog identifiers
+        blog = host
+    return (host, blog, int(match['post_id']))
+
+
+def resolve_post_url(url: str) -> PostLocation:
+    location = parse_post_url(url)
+    if location[2] or not url:
+        return location
+
+    try:
+        return fetch_post_url(url)
+    except requests.RequestException:
+        return location
+
+
+def resolve_post_urls(urls: Iterable[str]) -> List[PostLocation]:
+    urls = list(urls)
+    unresolved = list({
+        url for url in urls if url and not parse_post_url(url)[2]
+    })
+    resolved = {}
+    if unresolved:
+        with ThreadPoolExecutor(
+            max_workers=URL_RESOLVE_WORKERS,
+        ) as executor:
+            resolved = dict(zip(
+                unresolved,
+                executor.map(resolve_post_url, unresolved),
+            ))
+    return [resolved.get(url) or parse_post_url(url) for url in urls]
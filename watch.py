@@ -0,0 +1,293 @@
+import json
+import os
+import time
+
+from pprint import pformat
+from typing import Any, Dict, List
+
+from tumtum import constants, profiling
+from tumtum.post import Post
+from tumtum.preflight import preflight_reblogs
+
+
+WATCH_STATE_FILE = 'watch_state.json'
+WATCH_PAGE_SIZE = 20
+WATCH_MAX_PAGES = 5
+WATCH_MIN_INTERVAL = 60
+WATCH_MAX_INTERVAL = 60 * 60
+WATCH_MAX_ATTEMPTS = 3
+
+
+class Watcher:
+    state: Dict[str, Dict[str, Any]] = {}
+
+    def __init__(
+        self,
+        blogs: List[str]=None,
+        tags: List[str]=None,
+        state_file: str=WATCH_STATE_FILE,
+    ) -> None:
+        self.state_file = state_file
+        self.state = self.load_state()
+        for kind, names in (('blog', blogs), ('tag', tags)):
+            for name in names or []:
+                self.state.setdefault(
+                    self.source_key(kind, name),
+                    {
+                        'kind': kind,
+                        'name': name,
+                        'cursor': 0,
+                        'cursor_ids': [],
+                        'failures': {},
+                        'initialized': False,
+                        'interval': WATCH_MIN_INTERVAL,
+                        'next_poll': 0,
+                    },
+                )
+
+    def adapt_interval(
+        self,
+        source: Dict[str, Any],
+        num_new: int,
+    ) -> None:
+        # Poll busy sources more often and back off on quiet ones
+        if num_new:
+            interval = source['interval'] / 2
+        else:
+            interval = source['interval'] * 2
+        source['interval'] = min(
+            max(interval, WATCH_MIN_INTERVAL),
+            WATCH_MAX_INTERVAL,
+        )
+        source['next_poll'] = time.time() + source['interval']
+
+    def advance_cursor(
+        self,
+        source: Dict[str, Any],
+        post: Dict[str, Any],
+    ) -> None:
+        cursor = self.source_cursor(source, post)
+        if cursor > source['cursor']:
+            source['cursor'] = cursor
+            source['cursor_ids'] = []
+        if source['kind'] == 'tag' and cursor == source['cursor']:
+            # Timestamps are not unique, so remember who is at the cursor
+            source.setdefault('cursor_ids', []).append(post.get('id'))
+
+    def fetch_blog_posts(
+        self,
+        post_obj: Post,
+        source: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        cursor = source['cursor']
+        new_posts = []
+        for page in range(WATCH_MAX_PAGES):
+            client = post_obj.get_client(read_only=True)
+            response = client.posts(
+                source['name'],
+                limit=WATCH_PAGE_SIZE,
+                offset=page * WATCH_PAGE_SIZE,
+            )
+            post_obj.record_response(client, response)
+            posts = response.get('posts', [])
+            new_posts += [
+                p for p in posts if self.is_new_post(source, p)
+            ]
+            # A pinned post can be old, so it says nothing about paging
+            is_caught_up = (
+                not cursor
+                or len(posts) < WATCH_PAGE_SIZE
+                or any(
+                    p['id'] <= cursor for p in posts
+                    if not p.get('is_pinned')
+                )
+            )
+            if is_caught_up:
+                break
+        return new_posts
+
+    def fetch_new_posts(
+        self,
+        source: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        post_obj = Post()
+        if source['kind'] == 'blog':
+            posts = self.fetch_blog_posts(post_obj, source)
+        else:
+            posts = self.fetch_tag_posts(post_obj, source)
+
+        # Oldest first so the cursor only ever moves forward
+        return sorted(
+            posts,
+            key=lambda post: self.source_cursor(source, post),
+        )
+
+    def fetch_tag_posts(
+        self,
+        post_obj: Post,
+        source: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        cursor = source['cursor']
+        new_posts = []
+        before = 0
+        for page in range(WATCH_MAX_PAGES):
+            kwargs = {'limit': WATCH_PAGE_SIZE}
+            if before:
+                kwargs['before'] = before
+            client = post_obj.get_client(read_only=True)
+            posts = client.tagged(source['name'], **kwargs)
+            post_obj.record_response(client, posts)
+            if not isinstance(posts, list):
+                posts = []
+            new_posts += [
+                p for p in posts if self.is_new_post(source, p)
+            ]
+            is_caught_up = (
+                not cursor
+                or not posts
+                or any(not self.is_new_post(source, p) for p in posts)
+            )
+            if is_caught_up:
+                break
+            before = min(p['timestamp'] for p in posts)
+        return new_posts
+
+    def ingest(
+        self,
+        post_obj: Post,
+        post: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        return post_obj.post_reblog(post)
+
+    def is_new_post(
+        self,
+        source: Dict[str, Any],
+        post: Dict[str, Any],
+    ) -> bool:
+        cursor = self.source_cursor(source, post)
+        if cursor != source['cursor'] or source['kind'] == 'blog':
+            return cursor > source['cursor']
+        return post.get('id') not in source.get('cursor_ids', [])
+
+    def load_state(self) -> Dict[str, Dict[str, Any]]:
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                return json.load(f)
+        return {}
+
+    def make_post(self, post: Dict[str, Any]) -> Post:
+        post_obj = Post(post.get('post_url', ''))
+        post_obj.is_headless = True
+        post_obj.is_reblog = True
+        # Seed the cache so preflight and the reblog reuse this fetch
+        post_obj.cache_post(
+            (post_obj.blog_name, post_obj.post_id), post)
+        return post_obj
+
+    def poll_once(self) -> int:
+        # Profile the whole poll as one run when profiling is enabled
+        with profiling.run('Watcher.poll_once'):
+            return self.poll_sources()
+
+    def poll_source(self, source: Dict[str, Any]) -> int:
+        posts = self.fetch_new_posts(source)
+        # Older state files predate the flag, but had a cursor once polled
+        if not source.get('initialized', bool(source['cursor'])):
+            # First poll only records the high-water mark
+            for post in posts:
+                self.advance_cursor(source, post)
+            source['initialized'] = True
+            posts = []
+
+        post_objs = [self.make_post(post) for post in posts]
+        valid, problems = preflight_reblogs([
+            (post_obj, constants.BLOGS, post.get('reblog_key', ''))
+            for post_obj, post in zip(post_objs, posts)
+        ])
+        if problems:
+            print('Preflight problems:', pformat(problems))
+        valid_ids = {id(item['post_obj']) for item in valid}
+
+        num_ingested = 0
+        failures = source.setdefault('failures', {})
+        for post_obj, post in zip(post_objs, posts):
+            if id(post_obj) not in valid_ids:
+                # It would fail anyway, so move past it
+                self.advance_cursor(source, post)
+                self.save_state()
+                continue
+
+            post_key = str(post.get('id'))
+            try:
+                self.ingest(post_obj, post)
+            except Exception as e:
+                failures[post_key] = failures.get(post_key, 0) + 1
+                print(
+                    f'Failed to ingest {post.get("post_url")}',
+                    f'(attempt {failures[post_key]}):',
+                    pformat(e),
+                )
+                if failures[post_key] < WATCH_MAX_ATTEMPTS:
+                    break
+                # Give up on it so later posts aren't blocked forever
+                del failures[post_key]
+                self.advance_cursor(source, post)
+                self.save_state()
+                continue
+
+            failures.pop(post_key, None)
+            self.advance_cursor(source, post)
+            num_ingested += 1
+            self.save_state()
+
+        self.adapt_interval(source, num_ingested)
+        return num_ingested
+
+    def poll_sources(self) -> int:
+        num_ingested = 0
+        now = time.time()
+        for source in self.state.values():
+            if source['next_poll'] > now:
+                continue
+
+            try:
+                num_ingested += self.poll_source(source)
+            except Exception as e:
+                # Keep the other sources going and back off this one
+                print(
+                    f'Failed to poll {source["kind"]} {source["name"]}:',
+                    pformat(e),
+                )
+                self.adapt_interval(source, 0)
+            self.save_state()
+        return num_ingested
+
+    def run(self) -> None:
+        while True:
+            num_ingested = self.poll_once()
+            if num_ingested:
+                print(f'Ingested {num_ingested} new post(s)')
+            next_poll = min(
+                [s['next_poll'] for s in self.state.values()]
+                or [time.time() + WATCH_MIN_INTERVAL]
+            )
+            time.sleep(max(next_poll - time.time(), 1))
+
+    def save_state(self) -> None:
+        tmp_file = f'{self.state_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    @staticmethod
+    def source_cursor(
+        source: Dict[str, Any],
+        post: Dict[str, Any],
+    ) -> int:
+        if source['kind'] == 'blog':
+            return post.get('id', 0)
+        return post.get('timestamp', 0)
+
+    @staticmethod
+    def source_key(kind: str, name: str) -> str:
+        return f'{kind}:{name}'